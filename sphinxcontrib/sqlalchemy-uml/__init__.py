@@ -69,11 +69,22 @@
           'dot_table' : { 'bgcolor' : '#e7f2fa', 'color' : '#2980B9' },
        }
 
+    To speed up live reloading with sphinx-autobuild start the daemon, which
+    keeps engines, imported models and reflected schemas warm between builds::
+
+        python -m sphinxcontrib.sqlalchemy-uml.daemon
+
+    and enable it in the conf.py directive sauml_options, key: daemon.  Set it
+    to True to use the default socket or to the path of the socket.  The
+    directive uses the daemon if it is running and inspects in-process
+    otherwise.
+
     :copyright: Copyright 2019-20 by Marcello Perathoner <marcello@perathoner.de>
     :license: BSD, see LICENSE for details.
 
 """
 
+import functools
 import sys
 import traceback
 import types
@@ -88,8 +99,7 @@ from sphinx.util.logging import getLogger
 
 import pic
 
-import pbr.version
-
+# sagraph imports sqlalchemy only when asked to inspect something
 from . import sagraph
 
 NAME = 'sauml'
@@ -100,7 +110,29 @@ if False:
     from typing import Any, Dict  # noqa
     from sphinx.application import Sphinx  # noqa
 
-__version__ = pbr.version.VersionInfo ('sqlalchemy-uml').version_string ()
+
+@functools.lru_cache (maxsize = None)
+def get_version ():
+    """ Get the version pbr wrote into the installed package metadata. """
+
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Python < 3.8
+        import importlib_metadata as metadata
+
+    try:
+        return metadata.version ('sphinxcontrib-sqlalchemy-uml')
+    except metadata.PackageNotFoundError:
+        # running from a source checkout
+        return 'unknown'
+
+
+def __getattr__ (name):
+    # resolve __version__ only when somebody asks for it
+    if name == '__version__':
+        return get_version ()
+    raise AttributeError ('module %r has no attribute %r' % (__name__, name))
 
 
 class SaUmlError (ExtensionError):
@@ -177,16 +209,30 @@ class SaUmlDirective (pic.PicDirective):
         if args.urls and args.modules:
             raise SaUmlError ('Both :url: and :module: directives specified.')
 
+        data = None
+        socket_path = getattr (self.env.config, self.name + '_options').get ('daemon')
+        if socket_path:
+            from . import daemon
+
+            if socket_path is True:
+                socket_path = daemon.DEFAULT_SOCKET
+            try:
+                data = daemon.inspect (socket_path, args)
+            except (daemon.DaemonError, OSError) as e:
+                logger.warning ('sauml daemon unusable, inspecting in-process: %s' % e,
+                                location = (self.env.docname, self.lineno))
+
         try:
-            if args.urls:
-                data = sagraph.inspect_urls (args)
-            else:
-                data = sagraph.inspect_modules (args)
+            if data is None:
+                if args.urls:
+                    data = sagraph.inspect_urls (args)
+                else:
+                    data = sagraph.inspect_modules (args)
 
             return sagraph.format_as_dot (data, args, **kw)
 
         except Exception as e:
-            raise SaUmlError ('Cannot open database: %s (%s)' % self.arguments, e)
+            raise SaUmlError ('Cannot open database: %s (%s)' % (' '.join (args.arguments), e))
 
 
     def run (self):
@@ -207,4 +253,4 @@ def setup (app):
 
     app.add_directive (NAME, SaUmlDirective)
 
-    return {'version': __version__, 'parallel_read_safe': True}
+    return {'version': get_version (), 'parallel_read_safe': True}
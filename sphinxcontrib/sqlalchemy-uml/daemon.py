@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+"""
+    sphinxcontrib.sqlalchemy-uml.daemon
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    A long-running local server that keeps engines, imported models and
+    reflected schemas warm between Sphinx builds.
+
+    Under sphinx-autobuild every rebuild would otherwise pay for engine
+    creation, model imports and database reflection again.  Start the daemon
+    once::
+
+        python -m sphinxcontrib.sqlalchemy-uml.daemon [--socket PATH]
+
+    and tell the sauml directive to query it over a Unix socket.  The daemon
+    is off by default.  Set it to True to use the default socket or to the
+    path of the socket::
+
+        sauml_options = {
+            'daemon' : True,
+        }
+
+    If the daemon is not running or does not answer, the directive falls back
+    to in-process inspection.  The socket must live in a directory that is
+    owned by you and not writable by anybody else.
+
+    Cached reflections are invalidated by fingerprint: for models the
+    modification times of all modules imported from the project (the
+    directories on the client's sys.path outside stdlib and site-packages),
+    for databases a cheap catalog query.
+    Reflections of databases without a catalog query (see FINGERPRINT_SQL)
+    are not cached, only their engines are kept.  To drop all cached state
+    of a running daemon::
+
+        python -m sphinxcontrib.sqlalchemy-uml.daemon --flush
+
+    :copyright: Copyright 2019-20 by Marcello Perathoner <marcello@perathoner.de>
+    :license: BSD, see LICENSE for details.
+
+"""
+
+import functools
+import importlib
+import json
+import os
+import site
+import socket
+import stat
+import sys
+import sysconfig
+import tempfile
+import traceback
+import types
+
+UID = os.getuid () if hasattr (os, 'getuid') else None
+
+if os.environ.get ('XDG_RUNTIME_DIR'):
+    DEFAULT_SOCKET = os.path.join (os.environ['XDG_RUNTIME_DIR'], 'sauml', 'sauml.sock')
+else:
+    DEFAULT_SOCKET = os.path.join (tempfile.gettempdir (), 'sauml-%s' % UID, 'sauml.sock')
+
+CONNECT_TIMEOUT = 1.0
+
+# reflecting a big database may take a while, but don't hang the build forever
+TIMEOUT = 300.0
+
+# Cheap queries that change whenever the schema changes.  Reflections of
+# dialects not listed here are not cached.
+FINGERPRINT_SQL = {
+    'sqlite'     : 'PRAGMA schema_version',
+    'postgresql' : """
+        SELECT md5 (
+          (SELECT string_agg (oid::text || ':' || xmin::text, ',' ORDER BY oid) FROM pg_class) ||
+          (SELECT string_agg (attrelid::text || ':' || attnum::text || ':' || xmin::text, ','
+                              ORDER BY attrelid, attnum) FROM pg_attribute) ||
+          coalesce ((SELECT string_agg (oid::text || ':' || xmin::text, ',' ORDER BY oid)
+                     FROM pg_constraint), '') ||
+          coalesce ((SELECT string_agg (indexrelid::text || ':' || xmin::text, ',' ORDER BY indexrelid)
+                     FROM pg_index), '')
+        )
+    """,
+}
+
+# never evict ourselves, even if our checkout is on the client's sys.path
+OWN_DIR = os.path.dirname (os.path.dirname (os.path.abspath (__file__)))
+
+
+class DaemonError (Exception):
+    pass
+
+
+def system_dirs ():
+    """ Return the directories of the standard library and site-packages. """
+
+    dirs = set ()
+    paths = sysconfig.get_paths ()
+    for key in ('stdlib', 'platstdlib', 'purelib', 'platlib'):
+        if paths.get (key):
+            dirs.add (os.path.abspath (paths[key]))
+    if hasattr (site, 'getsitepackages'):
+        dirs.update (os.path.abspath (p) for p in site.getsitepackages ())
+    if hasattr (site, 'getusersitepackages'):
+        dirs.add (os.path.abspath (site.getusersitepackages ()))
+    return dirs
+
+
+def is_under (path, dirs):
+    """ Return true if path is one of dirs or inside one of them. """
+
+    return any (path == d or path.startswith (d + os.sep) for d in dirs)
+
+
+def check_private (path, st, mask = 0o077):
+    """ Raise unless st is owned by us and has none of the mode bits in mask. """
+
+    if st.st_uid != UID:
+        raise DaemonError ('%s is not owned by you' % path)
+    if st.st_mode & mask:
+        raise DaemonError ('%s is accessible by group or others' % path)
+
+
+def check_socket (path):
+    """ Make sure nobody else can impersonate the daemon at path.
+
+    Returns False if there is no socket at path.
+    """
+
+    try:
+        st = os.lstat (path)
+    except FileNotFoundError:
+        return False
+
+    if not stat.S_ISSOCK (st.st_mode):
+        raise DaemonError ('%s is not a socket' % path)
+    check_private (path, st)
+
+    # or else somebody could swap the socket after we checked it
+    parent = os.path.dirname (os.path.abspath (path))
+    check_private (parent, os.stat (parent), 0o022)
+    return True
+
+
+def query (path, request):
+    """ Send a request to the daemon.
+
+    Returns the decoded response or None if no daemon is listening on path.
+    Raises DaemonError if the socket is not private or the daemon misbehaves.
+    """
+
+    if not hasattr (socket, 'AF_UNIX'):
+        return None
+
+    if not check_socket (path):
+        return None
+
+    sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout (CONNECT_TIMEOUT)
+        sock.connect (path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # stale socket of a dead daemon
+        sock.close ()
+        return None
+
+    with sock:
+        sock.settimeout (TIMEOUT)
+        sock.sendall ((json.dumps (request) + '\n').encode ('utf-8'))
+        with sock.makefile ('rb') as f:
+            line = f.readline ()
+
+    if not line:
+        raise DaemonError ('Daemon at %s closed the connection' % path)
+    try:
+        return json.loads (line.decode ('utf-8'))
+    except ValueError as e:
+        raise DaemonError ('Bad response from daemon at %s: %s' % (path, e))
+
+
+def inspect (path, args):
+    """ Inspect urls or modules using the daemon.
+
+    Returns (objects, relations) like :func:`sagraph.inspect_urls` or None if
+    the daemon is not running.
+    """
+
+    response = query (path, {
+        'op'       : 'inspect',
+        'args'     : vars (args),
+        'sys_path' : [ os.path.abspath (p) for p in sys.path ],
+    })
+    if response is None:
+        return None
+    if 'error' in response:
+        raise DaemonError (response['error'])
+    return response['objects'], response['relations']
+
+
+class Cache (object):
+    """ The warm state kept by the daemon. """
+
+    def __init__ (self):
+        self.engines     = {} # url -> (pgpass mtime, engine)
+        self.reflections = {} # (url, schema) -> (fingerprint, meta, insp)
+        self.modules     = {} # (module names, roots) -> (fingerprint, classes)
+        self.roots       = set () # project directories we imported from
+
+    def flush (self):
+        for dummy_mtime, engine in self.engines.values ():
+            engine.dispose ()
+        self.evict (self.roots)
+        self.__init__ ()
+
+    def get_engine (self, url):
+        import sqlalchemy
+        from . import sagraph
+
+        try:
+            mtime = os.stat (os.path.expanduser ('~/.pgpass')).st_mtime
+        except OSError:
+            mtime = None
+
+        cached = self.engines.get (url)
+        if cached is None or cached[0] != mtime:
+            if cached is not None:
+                # the password may have changed
+                cached[1].dispose ()
+            cached = (mtime, sqlalchemy.create_engine (sagraph.get_pg_pass (url)))
+            self.engines[url] = cached
+        return cached[1]
+
+    def db_fingerprint (self, engine):
+        """ Return the schema fingerprint or None if the dialect has none. """
+
+        import sqlalchemy
+
+        sql = FINGERPRINT_SQL.get (engine.dialect.name)
+        if sql is None:
+            return None
+        with engine.connect () as conn:
+            return str (conn.execute (sqlalchemy.text (sql)).scalar ())
+
+    def reflect (self, url, schema = None):
+        """ Cached replacement for :func:`sagraph.reflect_url`. """
+
+        import sqlalchemy
+
+        engine = self.get_engine (url)
+        fingerprint = self.db_fingerprint (engine)
+
+        cached = self.reflections.get ((url, schema))
+        if cached is None or fingerprint is None or cached[0] != fingerprint:
+            meta = sqlalchemy.MetaData ()
+            meta.reflect (bind = engine, schema = schema)
+            cached = (fingerprint, meta, sqlalchemy.inspection.inspect (engine))
+            self.reflections[(url, schema)] = cached
+
+        return cached[1], cached[2]
+
+    @staticmethod
+    def project_roots (path):
+        """ Return the directories in path that are not stdlib or site-packages. """
+
+        system = system_dirs ()
+        return [ p for p in map (os.path.abspath, path)
+                 if os.path.isdir (p) and not is_under (p, system) ]
+
+    @staticmethod
+    def project_modules (roots):
+        """ Return a dict name -> file of the loaded modules imported from roots. """
+
+        system = system_dirs ()
+        modules = {}
+        for name, module in list (sys.modules.items ()):
+            path = getattr (module, '__file__', None)
+            if not path:
+                continue
+            path = os.path.abspath (path)
+            if is_under (path, roots) and not is_under (path, system) and not is_under (path, [OWN_DIR]):
+                modules[name] = path
+        return modules
+
+    @staticmethod
+    def file_fingerprint (files):
+        fingerprint = {}
+        for path in files:
+            try:
+                fingerprint[path] = os.stat (path).st_mtime
+            except OSError:
+                fingerprint[path] = None
+        return fingerprint
+
+    def evict (self, roots):
+        """ Drop the project modules so they get imported afresh. """
+
+        for name in self.project_modules (roots):
+            del sys.modules[name]
+        importlib.invalidate_caches ()
+
+    def load (self, modules, roots):
+        """ Cached replacement for :func:`sagraph.load_classes`.
+
+        The fingerprint covers every module imported from the project roots,
+        so that edits to the declarative Base or to mixins are seen too.
+        """
+
+        from . import sagraph
+
+        key = (tuple (modules), tuple (roots))
+        cached = self.modules.get (key)
+        if cached is None or cached[0] != self.file_fingerprint (cached[0]):
+            # The models go together with everything they import, else the
+            # stale Base.metadata would refuse to define the tables again.
+            self.evict (roots)
+            self.roots.update (roots)
+            classes = sagraph.load_classes (modules)
+            cached = (self.file_fingerprint (self.project_modules (roots).values ()), classes)
+            self.modules[key] = cached
+
+        return cached[1]
+
+    def inspect (self, request):
+        from . import sagraph
+
+        args = types.SimpleNamespace (**request['args'])
+
+        # the client's path goes first, but only for this request
+        saved_path = list (sys.path)
+        client_path = request.get ('sys_path', [])
+        sys.path[:] = client_path + [p for p in saved_path if p not in client_path]
+        try:
+            if args.urls:
+                objects, relations = sagraph.inspect_urls (args, reflect = self.reflect)
+            else:
+                load = functools.partial (self.load, roots = self.project_roots (client_path))
+                objects, relations = sagraph.inspect_modules (args, load = load)
+        finally:
+            sys.path[:] = saved_path
+
+        return { 'objects' : objects, 'relations' : relations }
+
+
+def make_server (path, cache = None):
+    """ Bind a server to the Unix socket at path. """
+
+    import socketserver
+
+    cache = cache or Cache ()
+
+    class Handler (socketserver.StreamRequestHandler):
+        def handle (self):
+            try:
+                request = json.loads (self.rfile.readline ().decode ('utf-8'))
+                op = request.get ('op')
+                if op == 'ping':
+                    response = { 'pong' : os.getpid () }
+                elif op == 'flush':
+                    cache.flush ()
+                    response = {}
+                elif op == 'inspect':
+                    response = cache.inspect (request)
+                else:
+                    response = { 'error' : 'Unknown op: %s' % op }
+            except Exception as e:
+                traceback.print_exc ()
+                response = { 'error' : '%s: %s' % (e.__class__.__name__, e) }
+            self.wfile.write ((json.dumps (response) + '\n').encode ('utf-8'))
+
+    # the daemon imports whatever modules it is asked to: owner only
+    parent = os.path.dirname (os.path.abspath (path))
+    os.makedirs (parent, mode = 0o700, exist_ok = True)
+    check_private (parent, os.stat (parent), 0o022)
+
+    if os.path.lexists (path):
+        if query (path, { 'op' : 'ping' }) is not None:
+            raise DaemonError ('Daemon already running at %s' % path)
+        os.unlink (path)
+
+    umask = os.umask (0o077)
+    try:
+        return socketserver.UnixStreamServer (path, Handler)
+    finally:
+        os.umask (umask)
+
+
+def serve (path, cache = None):
+    """ Serve requests on the Unix socket at path until interrupted. """
+
+    server = make_server (path, cache)
+
+    with server:
+        try:
+            server.serve_forever ()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink (path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser (description='Keep SQLAlchemy reflections warm for the sauml directive.')
+
+    parser.add_argument (
+        '-s', '--socket', default=DEFAULT_SOCKET,
+        help='The Unix socket to listen on (default: %(default)s)',
+    )
+
+    parser.add_argument (
+        '--flush', action='store_true',
+        help='Tell the running daemon to drop all cached state and exit.',
+    )
+
+    args = parser.parse_args ()
+
+    if args.flush:
+        if query (args.socket, { 'op' : 'flush' }) is None:
+            sys.stderr.write ('Error: no daemon listening on %s\n' % args.socket)
+            sys.exit (1)
+        sys.exit (0)
+
+    sys.stderr.write ('sauml daemon listening on %s\n' % args.socket)
+    serve (args.socket)
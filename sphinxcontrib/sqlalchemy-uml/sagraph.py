@@ -7,7 +7,8 @@ import re
 import sys
 import textwrap
 
-import sqlalchemy
+# sqlalchemy is imported inside the functions that need it, so that loading
+# the Sphinx extension stays cheap.
 
 DOT_ATTRS = ('graph', 'node', 'edge', 'table', 'td')
 
@@ -20,6 +21,8 @@ def get_pg_pass (url):
 
     """
 
+    import sqlalchemy
+
     URL = sqlalchemy.engine.url.make_url (url)
 
     if not URL.password:
@@ -67,17 +70,36 @@ def filter_regexp_list (regexes, items, negate = False):
                 yield item
 
 
-def inspect_urls (args):
-    """ Inspect databases. """
+def reflect_url (url, schema = None):
+    """ Connect to a database and reflect it.
+
+    Returns a reflected :class:`sqlalchemy.MetaData` and an inspector.
+    """
+
+    import sqlalchemy
+
+    engine = sqlalchemy.create_engine (get_pg_pass (url))
+
+    meta = sqlalchemy.MetaData ()
+    meta.reflect (bind = engine, schema = schema)
+
+    return meta, sqlalchemy.inspection.inspect (engine)
+
+
+def inspect_urls (args, reflect = reflect_url):
+    """ Inspect databases.
+
+    :param reflect: Callable (url, schema) -> (meta, inspector).  The daemon
+                    passes one that returns cached reflections.
+    """
+
+    import sqlalchemy
 
     objects = []
     relations = []
 
     for url in args.urls:
-        engine = sqlalchemy.create_engine (get_pg_pass (url))
-
-        meta = sqlalchemy.MetaData ()
-        meta.reflect (bind = engine, schema = args.schema)
+        meta, insp = reflect (url, args.schema)
 
         tables = meta.tables.keys ()
 
@@ -87,8 +109,6 @@ def inspect_urls (args):
         if args.exclude:
             tables = filter_regexp_list (args.exclude, tables, True)
 
-        insp = sqlalchemy.inspection.inspect (engine)
-
         for item in tables:
             if '.' in item:
                 schema, table = item.split ('.')
@@ -156,16 +176,29 @@ def inspect_urls (args):
     return objects, relations
 
 
-def inspect_modules (args):
-    """ Inspect Python modules. """
+def load_classes (modules):
+    """ Import Python modules and return a list of (name, class). """
+
+    classes = []
+    for name in modules:
+        module = importlib.import_module (name)
+        classes += inspect.getmembers (module, inspect.isclass)
+    return classes
+
+
+def inspect_modules (args, load = load_classes):
+    """ Inspect Python modules.
+
+    :param load: Callable (modules) -> list of (name, class).  The daemon
+                 passes one that returns cached imports.
+    """
+
+    import sqlalchemy
 
     objects = []
     relations = []
 
-    classes = [] # list of (name, object)
-    for name in args.modules:
-        module = importlib.import_module (name)
-        classes += inspect.getmembers (module, inspect.isclass)
+    classes = load (args.modules) # list of (name, object)
 
     if args.include:
         # respect order of include list
@@ -219,7 +252,7 @@ def inspect_modules (args):
             relations.append ({
                 'from' : table.name,
                 'by'   : r',\n'.join (label),
-                'to'   : fkc.referred_table,
+                'to'   : str (fkc.referred_table),
             })
 
     return objects, relations
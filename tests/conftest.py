@@ -6,4 +6,45 @@
     :license: BSD, see LICENSE for details.
 """
 
+import importlib
+import os
+import sqlite3
+import threading
+
+import pytest
+
 pytest_plugins = 'sphinx.testing.fixtures'
+
+daemon = importlib.import_module ('sphinxcontrib.sqlalchemy-uml.daemon')
+
+
+@pytest.fixture
+def socket_path (tmpdir):
+    return str (tmpdir.join ('sauml', 'sauml.sock'))
+
+
+@pytest.fixture
+def server (socket_path):
+    """ A daemon serving from a thread. """
+
+    srv = daemon.make_server (socket_path)
+    thread = threading.Thread (target = srv.serve_forever)
+    thread.start ()
+    yield socket_path
+    srv.shutdown ()
+    thread.join ()
+    srv.server_close ()
+    os.unlink (socket_path)
+
+
+@pytest.fixture
+def database (tmpdir):
+    """ An sqlite database with two tables and a foreign key. """
+
+    pytest.importorskip ('sqlalchemy')
+    path = str (tmpdir.join ('test.db'))
+    with sqlite3.connect (path) as conn:
+        conn.execute ('CREATE TABLE author (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.execute ('CREATE TABLE book (id INTEGER PRIMARY KEY, '
+                      'author_id INTEGER REFERENCES author (id))')
+    return path
@@ -0,0 +1,245 @@
+"""
+    Tests for the sauml daemon
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: Copyright 2019-20 by Marcello Perathoner <marcello@perathoner.de>
+    :license: BSD, see LICENSE for details.
+"""
+
+import importlib
+import os
+import sqlite3
+import sys
+import types
+
+import pytest
+
+daemon = importlib.import_module ('sphinxcontrib.sqlalchemy-uml.daemon')
+sagraph = importlib.import_module ('sphinxcontrib.sqlalchemy-uml.sagraph')
+
+MODELS = '''
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base ()
+
+class Author (Base):
+    __tablename__ = 'author'
+    id   = Column (Integer, primary_key = True)
+    name = Column (String)
+'''
+
+BASE = '''
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base ()
+'''
+
+APP_MODELS = '''
+from sqlalchemy import Column, Integer, String
+from .base import Base
+
+class Author (Base):
+    __tablename__ = 'author'
+    id   = Column (Integer, primary_key = True)
+    name = Column (String)
+'''
+
+BOOK = '''
+class Book (Base):
+    __tablename__ = 'book'
+    id        = Column (Integer, primary_key = True)
+    author_id = Column (Integer, ForeignKey ('author.id'))
+'''
+
+
+def make_args (**kw):
+    args = types.SimpleNamespace (
+        arguments = [], schema = None, include = [], exclude = [],
+        include_fields = [], include_indices = False, urls = [], modules = [],
+    )
+    args.__dict__.update (kw)
+    return args
+
+
+@pytest.fixture
+def models (tmpdir, monkeypatch):
+    pytest.importorskip ('sqlalchemy')
+    path = tmpdir.join ('sauml_test_models.py')
+    path.write (MODELS)
+    monkeypatch.syspath_prepend (str (tmpdir))
+    yield path
+    sys.modules.pop ('sauml_test_models', None)
+
+
+@pytest.fixture
+def app (tmpdir, monkeypatch):
+    """ A package with Base in a sibling module of the models. """
+
+    pytest.importorskip ('sqlalchemy')
+    package = tmpdir.mkdir ('sauml_test_app')
+    package.join ('__init__.py').write ('')
+    package.join ('base.py').write (BASE)
+    package.join ('models.py').write (APP_MODELS)
+    monkeypatch.syspath_prepend (str (tmpdir))
+    yield package
+    for name in list (sys.modules):
+        if name.split ('.')[0] == 'sauml_test_app':
+            del sys.modules[name]
+
+
+def touch (path, source = None):
+    """ Rewrite path and make sure its mtime changes. """
+
+    if source is not None:
+        path.write (source)
+    mtime = os.stat (str (path)).st_mtime + 10
+    os.utime (str (path), (mtime, mtime))
+
+
+def format_as_dot (data, args):
+    kw = { 'content' : '' }
+    for attr in sagraph.DOT_ATTRS:
+        kw[attr] = {}
+    return sagraph.format_as_dot (data, args, **kw)
+
+
+def test_ping (server):
+    assert daemon.query (server, { 'op' : 'ping' }) == { 'pong' : os.getpid () }
+
+
+def test_unknown_op (server):
+    assert 'error' in daemon.query (server, { 'op' : 'bogus' })
+
+
+def test_no_daemon (socket_path):
+    assert daemon.query (socket_path, { 'op' : 'ping' }) is None
+    assert daemon.inspect (socket_path, make_args (modules = ['os'])) is None
+
+
+def test_foreign_socket (server):
+    os.chmod (server, 0o777)
+    with pytest.raises (daemon.DaemonError):
+        daemon.query (server, { 'op' : 'ping' })
+
+
+def test_already_running (server):
+    with pytest.raises (daemon.DaemonError):
+        daemon.make_server (server)
+
+
+def test_inspect_url (server, database):
+    objects, relations = daemon.inspect (server, make_args (urls = ['sqlite:///' + database]))
+    assert sorted (o['name'] for o in objects) == ['author', 'book']
+    assert [ (r['from'], r['to']) for r in relations ] == [('book', 'author')]
+
+
+def test_same_dot_as_in_process (server, database):
+    args = make_args (urls = ['sqlite:///' + database])
+    assert format_as_dot (daemon.inspect (server, args), args) == \
+        format_as_dot (sagraph.inspect_urls (args), args)
+
+
+def test_sqlite_invalidation (database):
+    cache = daemon.Cache ()
+    url = 'sqlite:///' + database
+
+    meta, insp = cache.reflect (url)
+    assert cache.reflect (url)[0] is meta
+
+    with sqlite3.connect (database) as conn:
+        conn.execute ('ALTER TABLE author ADD COLUMN born INTEGER')
+
+    meta2, insp2 = cache.reflect (url)
+    assert meta2 is not meta
+    assert 'born' in meta2.tables['author'].columns
+    assert 'born' in [ c['name'] for c in insp2.get_columns ('author') ]
+
+
+def test_no_fingerprint_no_cache (database, monkeypatch):
+    monkeypatch.delitem (daemon.FINGERPRINT_SQL, 'sqlite')
+    cache = daemon.Cache ()
+    url = 'sqlite:///' + database
+
+    assert cache.reflect (url)[0] is not cache.reflect (url)[0]
+    assert len (cache.engines) == 1
+
+
+def test_superseded_engine_is_disposed (database, tmpdir, monkeypatch):
+    monkeypatch.setenv ('HOME', str (tmpdir))
+    pgpass = tmpdir.join ('.pgpass')
+    pgpass.write ('')
+    cache = daemon.Cache ()
+    url = 'sqlite:///' + database
+
+    engine = cache.get_engine (url)
+    disposed = []
+    monkeypatch.setattr (engine, 'dispose', lambda: disposed.append (engine))
+
+    touch (pgpass)
+    assert cache.get_engine (url) is not engine
+    assert disposed == [engine]
+    assert len (cache.engines) == 1
+
+
+def test_module_invalidation (models):
+    cache = daemon.Cache ()
+    roots = [ str (models.dirpath ()) ]
+
+    classes = dict (cache.load (['sauml_test_models'], roots))
+    assert 'Author' in classes and 'Book' not in classes
+    assert dict (cache.load (['sauml_test_models'], roots))['Author'] is classes['Author']
+
+    touch (models, MODELS + BOOK)
+
+    classes2 = dict (cache.load (['sauml_test_models'], roots))
+    assert 'Book' in classes2
+    assert classes2['Author'] is not classes['Author']
+
+
+def test_base_in_sibling_module (app):
+    cache = daemon.Cache ()
+    roots = [ str (app.dirpath ()) ]
+
+    classes = dict (cache.load (['sauml_test_app.models'], roots))
+
+    # reimporting the models alone would redefine 'author' on the old Base
+    touch (app.join ('models.py'))
+    classes2 = dict (cache.load (['sauml_test_app.models'], roots))
+    assert classes2['Author'] is not classes['Author']
+    assert classes2['Base'] is not classes['Base']
+
+    # edits to the models' dependencies are seen too
+    touch (app.join ('base.py'))
+    classes3 = dict (cache.load (['sauml_test_app.models'], roots))
+    assert classes3['Base'] is not classes2['Base']
+
+
+def test_flush_drops_modules (app):
+    cache = daemon.Cache ()
+    cache.load (['sauml_test_app.models'], [ str (app.dirpath ()) ])
+    assert 'sauml_test_app.base' in sys.modules
+
+    cache.flush ()
+    assert 'sauml_test_app.base' not in sys.modules
+
+
+def test_own_modules_are_never_evicted ():
+    # our own checkout may well be on the client's sys.path
+    checkout = os.path.dirname (daemon.OWN_DIR)
+    assert not [ name for name in daemon.Cache.project_modules ([checkout])
+                 if name.split ('.')[0] == 'sphinxcontrib' ]
+
+
+def test_sys_path_is_scoped (database):
+    cache = daemon.Cache ()
+    client_path = [ os.path.abspath ('no-such-dir') ]
+    saved_path = list (sys.path)
+
+    response = cache.inspect ({
+        'args'     : vars (make_args (urls = ['sqlite:///' + database])),
+        'sys_path' : client_path,
+    })
+
+    assert sorted (o['name'] for o in response['objects']) == ['author', 'book']
+    assert sys.path == saved_path
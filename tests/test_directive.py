@@ -0,0 +1,99 @@
+"""
+    Tests for the sauml directive's use of the daemon
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :copyright: Copyright 2019-20 by Marcello Perathoner <marcello@perathoner.de>
+    :license: BSD, see LICENSE for details.
+"""
+
+import importlib
+import types
+
+import pytest
+
+sauml = importlib.import_module ('sphinxcontrib.sqlalchemy-uml')
+daemon = importlib.import_module ('sphinxcontrib.sqlalchemy-uml.daemon')
+
+
+def make_directive (arguments, options):
+    """ A directive as docutils would set it up, minus the parsing. """
+
+    env = types.SimpleNamespace (
+        config  = types.SimpleNamespace (sauml_options = options),
+        docname = 'index',
+    )
+    directive = sauml.SaUmlDirective.__new__ (sauml.SaUmlDirective)
+    directive.state     = types.SimpleNamespace (
+        document = types.SimpleNamespace (settings = types.SimpleNamespace (env = env))
+    )
+    directive.arguments = arguments
+    directive.options   = {}
+    directive.content   = []
+    directive.lineno    = 1
+    return directive
+
+
+@pytest.fixture
+def calls (monkeypatch):
+    """ Record the calls to daemon.inspect and let it answer 'not running'. """
+
+    calls = []
+
+    def inspect (path, args):
+        calls.append (path)
+        return None
+
+    monkeypatch.setattr (daemon, 'inspect', inspect)
+    return calls
+
+
+@pytest.fixture
+def warnings (monkeypatch):
+    warnings = []
+    monkeypatch.setattr (sauml, 'logger', types.SimpleNamespace (
+        warning = lambda msg, **kw: warnings.append (msg)
+    ))
+    return warnings
+
+
+def get_code (database, **options):
+    return make_directive (['sqlite:///' + database], options).get_code ()
+
+
+def test_daemon_off_by_default (database, calls):
+    get_code (database)
+    get_code (database, daemon = None)
+    assert calls == []
+
+
+def test_daemon_default_socket (database, calls):
+    get_code (database, daemon = True)
+    assert calls == [daemon.DEFAULT_SOCKET]
+
+
+def test_daemon_socket_path (database, calls):
+    get_code (database, daemon = '/some/where/sauml.sock')
+    assert calls == ['/some/where/sauml.sock']
+
+
+def test_daemon_error_falls_back (database, warnings, monkeypatch):
+    def inspect (path, args):
+        raise daemon.DaemonError ('wedged')
+
+    monkeypatch.setattr (daemon, 'inspect', inspect)
+    assert get_code (database, daemon = True) == get_code (database)
+    assert len (warnings) == 1 and 'wedged' in warnings[0]
+
+
+def test_daemon_output_is_identical (database, server, monkeypatch):
+    answers = []
+    inspect = daemon.inspect
+
+    def spy (path, args):
+        answers.append (inspect (path, args))
+        return answers[-1]
+
+    monkeypatch.setattr (daemon, 'inspect', spy)
+    dot = get_code (database, daemon = server)
+    assert answers and answers[0] is not None
+    assert dot == get_code (database)
@@ -0,0 +1,58 @@
+"""
+    Guard the import time of the extension
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Every Sphinx invocation loads the extension, even if no page contains a
+    sauml directive.  SQLAlchemy and pbr must only be loaded when needed.
+
+    :copyright: Copyright 2019-20 by Marcello Perathoner <marcello@perathoner.de>
+    :license: BSD, see LICENSE for details.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# microseconds, cumulative import time of the extension itself
+BUDGET = 50000
+
+# Sphinx and its bundled sphinxcontrib extensions are already loaded when
+# Sphinx loads our extension.
+SCRIPT = '''
+import json, sys
+import sphinx.util.docutils, sphinxcontrib, pic
+sys.stderr.write ('--- start\\n')
+# -X importtime does not see importlib.import_module ()
+__import__ ('sphinxcontrib.sqlalchemy-uml')
+print (json.dumps (sorted (sys.modules)))
+'''
+
+
+@pytest.fixture (scope = 'module')
+def result ():
+    env = dict (os.environ, PYTHONPATH = os.pathsep.join (sys.path))
+    proc = subprocess.run (
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT],
+        stdout = subprocess.PIPE, stderr = subprocess.PIPE, env = env,
+        universal_newlines = True, check = True,
+    )
+    return json.loads (proc.stdout), proc.stderr.split ('--- start\n', 1)[1]
+
+
+def test_no_heavy_imports (result):
+    modules, dummy_importtime = result
+    assert not [ m for m in modules if m.split ('.')[0] in ('sqlalchemy', 'pbr') ]
+
+
+def test_import_time (result):
+    dummy_modules, importtime = result
+    for line in importtime.splitlines ():
+        # import time: self [us] | cumulative | imported package
+        fields = [ f.strip () for f in line.split (':', 1)[1].split ('|') ]
+        if fields[2] == 'sphinxcontrib.sqlalchemy-uml':
+            assert int (fields[1]) < BUDGET
+            return
+    pytest.fail ('extension not found in -X importtime output')